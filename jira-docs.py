@@ -1,5 +1,9 @@
 import requests
-import json
+import orjson
+import hashlib
+import sqlite3
+import threading
+import time
 from jira import JIRA
 import pandas as pd
 import os
@@ -9,13 +13,85 @@ from dotenv import load_dotenv
 import re
 import argparse
 from tqdm import tqdm
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import ReadTimeoutError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from itertools import islice
+from dataclasses import dataclass, field
 
 # Load environment variables
 load_dotenv()
 
+# Token budget for the issue content of a single prompt
+ISSUE_TOKEN_BUDGET = 4096
+
+# Context window requested from Ollama, sized for a full batch of small issues plus the responses
+# rather than the model's maximum, which keeps the KV cache small
+OLLAMA_NUM_CTX = 8192
+
+# Maximum number of tokens generated for the analysis of one issue
+ANALYSIS_NUM_PREDICT = 512
+
+# Sampling temperature of the analysis of one issue, kept low for factual answers
+ANALYSIS_TEMPERATURE = 0.2
+
+# Issues whose prompt text is at most this many tokens are batched together for the AI analysis
+SMALL_ISSUE_TOKENS = ISSUE_TOKEN_BUDGET // 4
+
+# Approximates the model tokenizer: CJK characters are about one token each, other text
+# about one token per short word chunk or punctuation mark
+TOKEN_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]|\w{1,6}|[^\w\s]')
+
+# System prompts are kept constant across calls so Ollama can reuse the cached prompt prefix
+ANALYSIS_SYSTEM_PROMPT = """You are a technical documentation assistant that analyzes Jira issues and comments to extract valuable information.
+
+For every Jira issue you are given, analyze the issue and its comments and extract:
+1. Key problems identified
+2. Solutions proposed or implemented
+3. Technical decisions made
+4. Any important information that should be documented"""
+
+SUMMARY_SYSTEM_PROMPT = "You are a technical documentation expert that synthesizes information into clear, concise summaries."
+
+# Attempts at an Ollama request before giving up, on top of the HTTP level retries of the session
+OLLAMA_ATTEMPTS = 3
+
+# Seconds to wait before the second attempt at an Ollama request, doubled for each further attempt
+OLLAMA_RETRY_BACKOFF = 2
+
+
+@dataclass(slots=True)
+class CommentRecord:
+    """The fields of a Jira comment used in the prompts"""
+    author: str
+    body: str
+
+
+@dataclass(slots=True)
+class IssueRecord:
+    """The fields of a Jira issue used downstream, and the result of its analysis"""
+    key: str
+    summary: str
+    description: str
+    status: str
+    issue_type: str
+    updated: str
+    comments: list = field(default_factory=list)
+    ai_analysis: str | None = None
+    analysis_failed: bool = False
+
+    @classmethod
+    def from_json(cls, line):
+        """Rebuild an issue from its line in the JSONL output"""
+        data = orjson.loads(line)
+        data['comments'] = [CommentRecord(**comment) for comment in data['comments']]
+        return cls(**data)
+
 
 class JiraDocumentationGenerator:
-    def __init__(self, jira_url, jira_token, jira_email, project_key, ollama_url="http://localhost:11434", model_name="llama3.2:latest"):
+    def __init__(self, jira_url, jira_token, jira_email, project_key, ollama_url="http://localhost:11434", model_name="llama3.2:latest", page_size=1000, batch_size=4, use_cache=True):
         """Initialize the Jira Documentation Generator with credentials and project info"""
         self.jira_url = jira_url
         self.jira_token = jira_token
@@ -23,6 +99,22 @@ class JiraDocumentationGenerator:
         self.project_key = project_key
         self.ollama_url = ollama_url
         self.model_name = model_name
+        self.page_size = page_size
+        self.batch_size = batch_size
+
+        # Ollama handles OLLAMA_NUM_PARALLEL requests at once, match it with our worker count
+        self.num_parallel = int(os.getenv('OLLAMA_NUM_PARALLEL', 4))
+
+        # Limits the requests in flight so a cold loading model isn't hit by every worker at once
+        self.ollama_slots = threading.Semaphore(self.num_parallel)
+
+        # Shared session so the Ollama calls reuse their connections, retrying with backoff while the server is overloaded.
+        # Read errors aren't retried, Ollama only answers once the generation is done so it would start all over.
+        self.session = requests.Session()
+        retry = Retry(total=5, read=False, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods={'POST'})
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
         # Initialize Jira client
         self.jira = JIRA(
@@ -34,146 +126,409 @@ class JiraDocumentationGenerator:
         if not os.path.exists('output'):
             os.makedirs('output')
 
+        # Analyzed issues are streamed to this file, it doubles as a checkpoint to resume an interrupted run
+        self.analysis_path = os.path.join('output', f"analysis_{self.project_key}.jsonl")
+
+        # Cache of Ollama responses so reruns don't send identical prompts again
+        self.cache = None
+        self.cache_lock = threading.Lock()
+        if use_cache:
+            self.cache = sqlite3.connect(os.path.join('output', '.ai_cache.sqlite'), check_same_thread=False)
+            self.cache.execute('PRAGMA journal_mode=WAL')
+            self.cache.execute('CREATE TABLE IF NOT EXISTS prompt_cache (prompt_hash TEXT PRIMARY KEY, response TEXT)')
+            # Per issue analyses, so reruns only analyze new or updated issues even when they were batched differently
+            self.cache.execute(
+                'CREATE TABLE IF NOT EXISTS issue_analyses (key TEXT, updated TEXT, model TEXT, prompt_hash TEXT, response TEXT, '
+                'PRIMARY KEY (key, updated, model, prompt_hash))'
+            )
+
     def get_all_issues(self):
-        """Fetch all issues for the given project"""
+        """Fetch all issues for the given project, yielding them a page at a time"""
         print(f"Fetching issues for project {self.project_key}...")
-        issues = []
 
         # Use JQL to query all issues for the project
         jql_str = f'project = {self.project_key} ORDER BY created DESC'
 
+        # Only request the fields we actually use to keep the payloads small.
+        # Comments are included so they don't need a request per issue.
+        fields = 'summary,description,status,issuetype,updated,comment'
+
         # Get issues with pagination (Jira API limits results)
-        start_at = 0
-        max_results = 100
-        total = 100  # Initial value to start the loop
+        max_results = self.page_size
+
+        def fetch_page(start_at):
+            return self.jira.search_issues(jql_str, startAt=start_at, maxResults=max_results, fields=fields)
 
         with tqdm(desc="Fetching issues", unit="issues") as pbar:
-            while start_at < total:
-                results = self.jira.search_issues(jql_str, startAt=start_at, maxResults=max_results)
+            # The first page also tells us how many issues there are in total
+            first_page = fetch_page(0)
+            total = first_page.total
+            pbar.total = total
+            pbar.update(len(first_page))
+            yield first_page
+
+            # Jira silently caps maxResults, so fall back to the page size the server returned
+            if 0 < len(first_page) < max_results and len(first_page) < total:
+                print(f"Warning: Jira returned {len(first_page)} issues per page instead of {max_results}, using the smaller page size")
+                max_results = len(first_page)
+
+            # Fetch the remaining pages concurrently, each request mostly waits on Jira.
+            # The client's requests.Session is safe to share for independent requests.
+            # Only a few pages are fetched ahead so they don't pile up in memory while
+            # the rest of the pipeline works through them.
+            max_workers = 8
+            pending_pages = deque()
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for start_at in range(max_results, total, max_results):
+                    pending_pages.append(executor.submit(fetch_page, start_at))
+                    if len(pending_pages) == max_workers:
+                        results = pending_pages.popleft().result()
+                        pbar.update(len(results))
+                        yield results
+
+                while pending_pages:
+                    results = pending_pages.popleft().result()
+                    pbar.update(len(results))
+                    yield results
+
+    def extract_issue_data(self, pages):
+        """Extract relevant data from pages of issues including comments, yielding one issue at a time"""
+        print("Extracting data from issues and comments...")
 
-                if start_at == 0:
-                    total = results.total
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            for issues in pages:
+                # Comments come back inline with the search results. Only issues with more
+                # comments than the search embeds need a separate (concurrent) request.
+                overflow_futures = {
+                    issue.key: executor.submit(self.jira.comments, issue)
+                    for issue in issues
+                    if issue.fields.comment.total > len(issue.fields.comment.comments)
+                }
 
-                issues.extend(results)
-                start_at += len(results)
-                pbar.update(len(results))
-                pbar.total = total
+                for issue in issues:
+                    # Get basic issue info
+                    issue_info = IssueRecord(
+                        key=issue.key,
+                        summary=issue.fields.summary,
+                        description=issue.fields.description or "",
+                        status=issue.fields.status.name,
+                        issue_type=issue.fields.issuetype.name,
+                        updated=issue.fields.updated
+                    )
+
+                    # Get comments
+                    if issue.key in overflow_futures:
+                        comments = overflow_futures[issue.key].result()
+                    else:
+                        comments = issue.fields.comment.comments
+                    for comment in comments:
+                        issue_info.comments.append(CommentRecord(
+                            author=comment.author.displayName,
+                            body=comment.body
+                        ))
+
+                    yield issue_info
+
+    def get_cached_response(self, prompt_hash):
+        """Return the cached Ollama response for a prompt hash, or None"""
+        if self.cache is None:
+            return None
 
-        return issues
+        with self.cache_lock:
+            row = self.cache.execute('SELECT response FROM prompt_cache WHERE prompt_hash = ?', (prompt_hash,)).fetchone()
+        return row[0] if row else None
 
-    def get_comments_for_issue(self, issue):
-        """Fetch all comments for a given issue"""
-        comments = self.jira.comments(issue)
-        return comments
+    def store_cached_response(self, prompt_hash, response):
+        """Store an Ollama response in the cache"""
+        if self.cache is None:
+            return
 
-    def extract_issue_data(self, issues):
-        """Extract relevant data from issues including comments"""
-        print("Extracting data from issues and comments...")
-        issue_data = []
-
-        with tqdm(total=len(issues), desc="Processing issues") as pbar:
-            for issue in issues:
-                # Get basic issue info
-                issue_info = {
-                    'key': issue.key,
-                    'summary': issue.fields.summary,
-                    'description': issue.fields.description or "",
-                    'status': issue.fields.status.name,
-                    'issue_type': issue.fields.issuetype.name,
-                    'created': issue.fields.created,
-                    'updated': issue.fields.updated,
-                    'comments': []
-                }
+        with self.cache_lock, self.cache:
+            self.cache.execute('INSERT OR REPLACE INTO prompt_cache (prompt_hash, response) VALUES (?, ?)', (prompt_hash, response))
 
-                # Get comments
-                comments = self.get_comments_for_issue(issue)
-                for comment in comments:
-                    issue_info['comments'].append({
-                        'author': comment.author.displayName,
-                        'body': comment.body,
-                        'created': comment.created
-                    })
+    def analysis_cache_key(self, issue, issue_text):
+        """Return the cache key of an issue's analysis, it changes with the issue, the model, the prompt and the generation options"""
+        prompt = f"{ANALYSIS_TEMPERATURE}\0{ANALYSIS_NUM_PREDICT}\0{OLLAMA_NUM_CTX}\0{ANALYSIS_SYSTEM_PROMPT}\0{self.build_analysis_prompt(issue_text)}"
+        prompt_hash = hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+        return issue.key, issue.updated, self.model_name, prompt_hash
 
-                issue_data.append(issue_info)
-                pbar.update(1)
+    def get_cached_analysis(self, issue, issue_text):
+        """Return the cached analysis of an issue, or None"""
+        if self.cache is None:
+            return None
 
-        return issue_data
+        with self.cache_lock:
+            row = self.cache.execute(
+                'SELECT response FROM issue_analyses WHERE key = ? AND updated = ? AND model = ? AND prompt_hash = ?',
+                self.analysis_cache_key(issue, issue_text)
+            ).fetchone()
+        return row[0] if row else None
 
-    def call_ollama(self, prompt, temperature=0.2):
-        """Call the local Ollama model for analysis"""
-        api_url = f"{self.ollama_url}/api/generate"
+    def store_cached_analysis(self, issue, issue_text, analysis):
+        """Store the analysis of an issue in the cache"""
+        if self.cache is None:
+            return
+
+        with self.cache_lock, self.cache:
+            self.cache.execute(
+                'INSERT OR REPLACE INTO issue_analyses (key, updated, model, prompt_hash, response) VALUES (?, ?, ?, ?, ?)',
+                (*self.analysis_cache_key(issue, issue_text), analysis)
+            )
+
+    def call_ollama(self, prompt, temperature=ANALYSIS_TEMPERATURE, system=ANALYSIS_SYSTEM_PROMPT, num_predict=ANALYSIS_NUM_PREDICT, response_format=None):
+        """Call the local Ollama model for analysis.
+
+        response_format ("json" or a JSON schema) constrains the output. Raises the last error when every attempt failed.
+        """
+        api_url = f"{self.ollama_url}/api/chat"
+
+        prompt_hash = hashlib.sha256(f"{self.model_name}\0{temperature}\0{num_predict}\0{response_format}\0{system}\0{prompt}".encode()).hexdigest()
+        cached_response = self.get_cached_response(prompt_hash)
+        if cached_response is not None:
+            return cached_response
 
         payload = {
             "model": self.model_name,
-            "prompt": prompt,
-            "temperature": temperature,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            "options": {
+                "temperature": temperature,
+                "num_ctx": OLLAMA_NUM_CTX,
+                "num_predict": num_predict
+            },
             "stream": False
         }
 
-        try:
-            response = requests.post(api_url, json=payload)
-            response.raise_for_status()  # Raise exception for 4XX/5XX responses
-            return response.json().get('response', '')
-        except Exception as e:
-            print(f"Error calling Ollama API: {str(e)}")
-            return f"Error analyzing with Ollama: {str(e)}"
+        if response_format is not None:
+            payload["format"] = response_format
+
+        for attempt in range(OLLAMA_ATTEMPTS):
+            try:
+                with self.ollama_slots:
+                    # Connect quickly or fail, but give the model plenty of time to generate
+                    response = self.session.post(api_url, json=payload, timeout=(5, 600))
+                    response.raise_for_status()  # Raise exception for 4XX/5XX responses
+                    result = orjson.loads(response.content).get('message', {}).get('content', '')
+                break
+            except requests.RequestException as e:
+                # The generation outlasted the read timeout, running it again would take as long.
+                # requests reports a timeout while reading a streamed body as a ConnectionError.
+                timed_out = isinstance(e, requests.ReadTimeout) or bool(e.args) and isinstance(e.args[0], ReadTimeoutError)
+                if timed_out or attempt == OLLAMA_ATTEMPTS - 1:
+                    raise
+                print(f"Error calling Ollama API, retrying: {str(e)}")
+                time.sleep(OLLAMA_RETRY_BACKOFF * 2 ** attempt)
+
+        if response_format is not None:
+            try:
+                orjson.loads(result)
+            except orjson.JSONDecodeError:
+                # The structured answer was cut off at num_predict, leave it out of the cache
+                return result
+
+        self.store_cached_response(prompt_hash, result)
+        return result
+
+    def estimate_tokens(self, text):
+        """Estimate the number of model tokens in a text"""
+        return len(TOKEN_PATTERN.findall(text))
+
+    def truncate_to_tokens(self, text, max_tokens):
+        """Cut a text after its first max_tokens estimated tokens"""
+        for count, match in enumerate(TOKEN_PATTERN.finditer(text), 1):
+            if count == max_tokens:
+                return text[:match.end()]
+        return text
+
+    def build_issue_text(self, issue):
+        """Prepare the text describing an issue and its comments for the AI prompts"""
+        # Leave room for the comments, they usually hold the actual solution
+        description_budget = ISSUE_TOKEN_BUDGET // 2 if issue.comments else ISSUE_TOKEN_BUDGET
+        description = issue.description
+        if self.estimate_tokens(description) > description_budget:
+            description = self.truncate_to_tokens(description, description_budget) + "... (truncated)"
+
+        issue_text = f"Issue: {issue.key} - {issue.summary}\n"
+        issue_text += f"Description: {description}\n"
+        issue_text += f"Status: {issue.status}\n"
+        issue_text += f"Type: {issue.issue_type}\n\n"
+
+        # Add comments from newest to oldest until the token budget is used up
+        remaining_tokens = ISSUE_TOKEN_BUDGET - self.estimate_tokens(issue_text)
+        comment_texts = []
+        for comment in reversed(issue.comments):
+            comment_text = f"- {comment.author}: {comment.body}\n\n"
+            comment_tokens = self.estimate_tokens(comment_text)
+            if comment_tokens > remaining_tokens:
+                # Keep at least the start of the newest comment
+                if not comment_texts and remaining_tokens > 0:
+                    comment_texts.append(self.truncate_to_tokens(comment_text, remaining_tokens) + "... (truncated)\n\n")
+                break
+            comment_texts.append(comment_text)
+            remaining_tokens -= comment_tokens
+
+        if comment_texts:
+            issue_text += "Comments:\n"
+            omitted = len(issue.comments) - len(comment_texts)
+            if omitted:
+                issue_text += f"({omitted} older comments omitted)\n\n"
+            issue_text += "".join(reversed(comment_texts))
+
+        return issue_text
+
+    def group_issues(self, issue_data):
+        """Group the issues without a cached analysis into batches of (issue, issue_text) pairs, large issues get a batch of their own"""
+        batches = []
+        pending = []
+
+        for issue in issue_data:
+            issue_text = self.build_issue_text(issue)
+
+            # Reuse the analysis of issues that didn't change since a previous run
+            cached_analysis = self.get_cached_analysis(issue, issue_text)
+            if cached_analysis is not None:
+                issue.ai_analysis = cached_analysis
+                continue
+
+            if self.batch_size > 1 and self.estimate_tokens(issue_text) <= SMALL_ISSUE_TOKENS:
+                pending.append((issue, issue_text))
+                if len(pending) == self.batch_size:
+                    batches.append(pending)
+                    pending = []
+            else:
+                batches.append([(issue, issue_text)])
 
-    def analyze_with_ai(self, issue_data):
-        """Use Ollama to analyze the issues and comments to identify solutions and issues"""
-        print(f"Analyzing issues and comments with Ollama model {self.model_name}...")
-        analyzed_data = []
+        if pending:
+            batches.append(pending)
 
-        with tqdm(total=len(issue_data), desc="AI analysis") as pbar:
-            for issue in issue_data:
-                # Prepare the text for analysis
-                issue_text = f"Issue: {issue['key']} - {issue['summary']}\n"
-                issue_text += f"Description: {issue['description']}\n"
-                issue_text += f"Status: {issue['status']}\n"
-                issue_text += f"Type: {issue['issue_type']}\n\n"
+        return batches
 
-                if issue['comments']:
-                    issue_text += "Comments:\n"
-                    for comment in issue['comments']:
-                        issue_text += f"- {comment['author']}: {comment['body']}\n\n"
+    def build_analysis_prompt(self, issue_text):
+        """Build the prompt to analyze a single issue"""
+        return f"""
+        Analyze the following Jira issue and its comments.
 
-                # Skip if issue is too large (to avoid token limits)
-                if len(issue_text) > 8000:
-                    issue_text = issue_text[:8000] + "... (truncated)"
+        Provide the analysis in a structured format.
 
-                # Define the prompt for the AI
-                prompt = f"""
-                You are a technical documentation assistant that analyzes Jira issues and comments to extract valuable information.
+        {issue_text}
+        """
 
-                Analyze the following Jira issue and its comments. Extract:
-                1. Key problems identified
-                2. Solutions proposed or implemented
-                3. Technical decisions made
-                4. Any important information that should be documented
+    def analyze_issue(self, issue, issue_text):
+        """Analyze a single issue with Ollama and store the result on the issue"""
+        try:
+            # Call Ollama API
+            analysis = self.call_ollama(self.build_analysis_prompt(issue_text))
+            issue.ai_analysis = analysis
+            self.store_cached_analysis(issue, issue_text, analysis)
+        except Exception as e:
+            print(f"Error analyzing issue {issue.key}: {str(e)}")
+            issue.ai_analysis = "Error during analysis"
+            issue.analysis_failed = True
+
+    def analyze_batch(self, batch):
+        """Analyze a batch of issues with a single Ollama call, falling back to one call per issue when the answer can't be used"""
+        if len(batch) == 1:
+            self.analyze_issue(*batch[0])
+            return
 
-                Provide the analysis in a structured format.
+        issues_text = "\n\n".join(f"=== ISSUE {issue.key} ===\n{issue_text}" for issue, issue_text in batch)
 
-                {issue_text}
-                """
+        prompt = f"""
+        Analyze each of the following Jira issues and their comments independently.
 
-                try:
-                    # Call Ollama API
-                    analysis = self.call_ollama(prompt)
+        Respond with a JSON object that has one entry per issue, keyed by the issue key:
+        {{
+          "ISSUE-KEY": "The structured analysis of the issue"
+        }}
 
-                    # Add the analysis to the issue data
-                    issue['ai_analysis'] = analysis
-                    analyzed_data.append(issue)
+        {issues_text}
+        """
 
-                except Exception as e:
-                    print(f"Error analyzing issue {issue['key']}: {str(e)}")
-                    issue['ai_analysis'] = "Error during analysis"
-                    analyzed_data.append(issue)
+        # Constrain the response to an object with exactly the issue keys of the batch
+        keys = [issue.key for issue, _ in batch]
+        response_schema = {
+            "type": "object",
+            "properties": {key: {"type": "string"} for key in keys},
+            "required": keys
+        }
 
+        try:
+            analyses = orjson.loads(self.call_ollama(prompt, num_predict=ANALYSIS_NUM_PREDICT * len(batch), response_format=response_schema))
+            # Make sure every issue of the batch got an analysis before using any of them
+            batch_analyses = [analyses[key] for key in keys]
+            for analysis in batch_analyses:
+                if not isinstance(analysis, str):
+                    raise TypeError(f"unexpected analysis entry {analysis!r}")
+        except requests.RequestException as e:
+            # Ollama is unreachable, one call per issue would only fail more slowly
+            print(f"Error analyzing a batch of {len(batch)} issues: {str(e)}")
+            for issue, _ in batch:
+                issue.ai_analysis = "Error during analysis"
+                issue.analysis_failed = True
+            return
+        except (orjson.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"Warning: Couldn't parse batched analysis, analyzing {len(batch)} issues individually: {str(e)}")
+            for issue, issue_text in batch:
+                self.analyze_issue(issue, issue_text)
+            return
+
+        for (issue, issue_text), analysis in zip(batch, batch_analyses):
+            issue.ai_analysis = analysis
+            self.store_cached_analysis(issue, issue_text, analysis)
+
+    def analyze_window(self, executor, issues, pbar):
+        """Analyze a window of issues concurrently, returns once all of them are analyzed"""
+        # Issues without a description or comments carry nothing for the model to analyze
+        issues_to_analyze = []
+        for issue in issues:
+            if not issue.description.strip() and not issue.comments:
+                issue.ai_analysis = "No content to analyze"
                 pbar.update(1)
+            else:
+                issues_to_analyze.append(issue)
+
+        # Issues with a cached analysis are left out of the batches
+        batches = self.group_issues(issues_to_analyze)
+        pbar.update(len(issues_to_analyze) - sum(len(batch) for batch in batches))
 
-        return analyzed_data
+        # Small issues are analyzed several at a time to amortize the prompt overhead,
+        # and the batches are sent concurrently to keep every Ollama slot busy
+        futures = {executor.submit(self.analyze_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            future.result()
+            pbar.update(len(futures[future]))
 
-    def categorize_issues(self, analyzed_data):
-        """Categorize issues based on their type and content"""
+    def analyze_with_ai(self, issue_data):
+        """Use Ollama to analyze the issues and comments to identify solutions and issues, yielding the analyzed issues"""
+        print(f"Analyzing issues and comments with Ollama model {self.model_name}...")
+
+        # Only a window of issues is held in memory at a time, large enough to keep Ollama busy
+        window_size = self.num_parallel * self.batch_size * 4
+        issue_iter = iter(issue_data)
+
+        with ThreadPoolExecutor(max_workers=self.num_parallel) as executor, tqdm(desc="AI analysis", unit="issues") as pbar:
+            while window := list(islice(issue_iter, window_size)):
+                self.analyze_window(executor, window, pbar)
+                yield from window
+
+    def classify_issue_type(self, issue_type):
+        """Map a Jira issue type name to its documentation category"""
+        issue_type = issue_type.lower()
+        if 'bug' in issue_type:
+            return 'Bugs'
+        elif 'feature' in issue_type or 'story' in issue_type:
+            return 'Features'
+        elif 'documentation' in issue_type:
+            return 'Documentation'
+        elif 'technical' in issue_type or 'debt' in issue_type:
+            return 'Technical Debt'
+        else:
+            return 'Other'
+
+    def categorize_issues(self):
+        """Categorize the analyzed issues based on their type, returning the offsets of each category's issues in the analysis file"""
         print("Categorizing issues...")
         categories = {
             'Features': [],
@@ -183,31 +538,61 @@ class JiraDocumentationGenerator:
             'Other': []
         }
 
-        for issue in analyzed_data:
-            if 'bug' in issue['issue_type'].lower():
-                categories['Bugs'].append(issue)
-            elif 'feature' in issue['issue_type'].lower() or 'story' in issue['issue_type'].lower():
-                categories['Features'].append(issue)
-            elif 'documentation' in issue['issue_type'].lower():
-                categories['Documentation'].append(issue)
-            elif 'technical' in issue['issue_type'].lower() or 'debt' in issue['issue_type'].lower():
-                categories['Technical Debt'].append(issue)
-            else:
-                categories['Other'].append(issue)
+        # A project only uses a handful of issue types, so classify each type name once
+        type_map = {}
+        offset = 0
+        with open(self.analysis_path, 'rb') as analysis_file:
+            for line in analysis_file:
+                issue_type = orjson.loads(line)['issue_type']
+                if issue_type not in type_map:
+                    type_map[issue_type] = self.classify_issue_type(issue_type)
+                categories[type_map[issue_type]].append(offset)
+                offset += len(line)
 
         return categories
 
+    def read_issues(self, offsets):
+        """Read analyzed issues back from the analysis file at the given offsets"""
+        with open(self.analysis_path, 'rb') as analysis_file:
+            for offset in offsets:
+                analysis_file.seek(offset)
+                yield IssueRecord.from_json(analysis_file.readline())
+
+    def load_checkpoint(self):
+        """Return the keys of the issues an interrupted run already analyzed successfully"""
+        if not os.path.exists(self.analysis_path):
+            return set()
+
+        analyzed_keys = set()
+        kept_path = self.analysis_path + '.tmp'
+        with open(self.analysis_path, 'rb') as analysis_file, open(kept_path, 'wb') as kept_file:
+            for line in analysis_file:
+                # A killed run can leave a partially written last line behind
+                if not line.endswith(b'\n'):
+                    break
+                issue = orjson.loads(line)
+                # Issues whose analysis failed are dropped so they are analyzed again
+                if issue.get('analysis_failed'):
+                    continue
+                analyzed_keys.add(issue['key'])
+                kept_file.write(line)
+        os.replace(kept_path, self.analysis_path)
+
+        if analyzed_keys:
+            print(f"Resuming previous run, {len(analyzed_keys)} issues were already analyzed")
+        return analyzed_keys
+
     def generate_documentation(self, categorized_data):
         """Generate comprehensive documentation from the analyzed data"""
         print("Generating comprehensive documentation...")
 
         # Create a prompt for the executive summary
         all_analyses = []
-        for category, issues in categorized_data.items():
-            if issues:
+        for category, offsets in categorized_data.items():
+            if offsets:
                 all_analyses.append(f"Category: {category}")
-                for issue in issues[:3]:  # Limit to 3 issues per category to avoid token limits
-                    all_analyses.append(f"Issue {issue['key']}: {issue['summary']}\nAnalysis: {issue['ai_analysis'][:500]}...")
+                for issue in self.read_issues(offsets[:3]):  # Limit to 3 issues per category to avoid token limits
+                    all_analyses.append(f"Issue {issue.key}: {issue.summary}\nAnalysis: {issue.ai_analysis[:500]}...")
 
         summary_text = "\n\n".join(all_analyses)
 
@@ -216,8 +601,6 @@ class JiraDocumentationGenerator:
             summary_text = summary_text[:10000] + "... (truncated)"
 
         summary_prompt = f"""
-        You are a technical documentation expert that synthesizes information into clear, concise summaries.
-
         Based on the following analyses of Jira issues for project {self.project_key}, 
         write an executive summary that highlights:
 
@@ -234,7 +617,7 @@ class JiraDocumentationGenerator:
 
         try:
             # Call Ollama for executive summary
-            executive_summary = self.call_ollama(summary_prompt, temperature=0.3)
+            executive_summary = self.call_ollama(summary_prompt, temperature=0.3, system=SUMMARY_SYSTEM_PROMPT, num_predict=2 * ANALYSIS_NUM_PREDICT)
 
         except Exception as e:
             print(f"Error generating executive summary: {str(e)}")
@@ -256,39 +639,40 @@ class JiraDocumentationGenerator:
 
         class PDF(FPDF):
             def header(self):
-                self.set_font('Arial', 'B', 12)
-                self.cell(0, 10, documentation['title'], 0, 1, 'C')
+                self.set_font('Helvetica', 'B', 12)
+                self.cell(0, 10, documentation['title'], align='C', new_x="LMARGIN", new_y="NEXT")
                 self.ln(5)
 
             def footer(self):
                 self.set_y(-15)
-                self.set_font('Arial', 'I', 8)
-                self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+                self.set_font('Helvetica', 'I', 8)
+                self.cell(0, 10, f'Page {self.page_no()}', align='C')
 
             def chapter_title(self, title):
-                self.set_font('Arial', 'B', 14)
+                self.set_font('Helvetica', 'B', 14)
                 self.set_fill_color(200, 220, 255)
-                self.cell(0, 10, title, 0, 1, 'L', 1)
+                self.cell(0, 10, title, align='L', fill=True, new_x="LMARGIN", new_y="NEXT")
                 self.ln(5)
 
             def chapter_body(self, body):
-                self.set_font('Arial', '', 11)
-                self.multi_cell(0, 5, body)
+                self.set_font('Helvetica', '', 11)
+                self.multi_cell(0, 5, body, new_x="LMARGIN", new_y="NEXT")
                 self.ln()
 
             def section_title(self, title):
-                self.set_font('Arial', 'B', 12)
-                self.cell(0, 8, title, 0, 1, 'L')
+                self.set_font('Helvetica', 'B', 12)
+                self.cell(0, 8, title, align='L', new_x="LMARGIN", new_y="NEXT")
                 self.ln(3)
 
         pdf = PDF()
+        pdf.set_auto_page_break(auto=True, margin=15)
         pdf.add_page()
 
         # Add title
-        pdf.set_font('Arial', 'B', 16)
-        pdf.cell(0, 10, documentation['title'], 0, 1, 'C')
-        pdf.set_font('Arial', 'I', 10)
-        pdf.cell(0, 10, f"Generated on {documentation['date']}", 0, 1, 'C')
+        pdf.set_font('Helvetica', 'B', 16)
+        pdf.cell(0, 10, documentation['title'], align='C', new_x="LMARGIN", new_y="NEXT")
+        pdf.set_font('Helvetica', 'I', 10)
+        pdf.cell(0, 10, f"Generated on {documentation['date']}", align='C', new_x="LMARGIN", new_y="NEXT")
         pdf.ln(10)
 
         # Add executive summary
@@ -297,19 +681,19 @@ class JiraDocumentationGenerator:
         pdf.ln(10)
 
         # Add categorized issues
-        for category_name, issues in documentation['categories'].items():
-            if issues:  # Only add categories that have issues
+        for category_name, offsets in documentation['categories'].items():
+            if offsets:  # Only add categories that have issues
                 pdf.add_page()
                 pdf.chapter_title(category_name)
 
-                for issue in issues:
-                    pdf.section_title(f"{issue['key']}: {issue['summary']}")
-                    pdf.chapter_body(f"Status: {issue['status']}\n")
+                for issue in self.read_issues(offsets):
+                    pdf.section_title(f"{issue.key}: {issue.summary}")
+                    pdf.chapter_body(f"Status: {issue.status}\n")
 
-                    if issue['description']:
-                        pdf.chapter_body(f"Description: {issue['description'][:500]}..." if len(issue['description']) > 500 else f"Description: {issue['description']}")
+                    if issue.description:
+                        pdf.chapter_body(f"Description: {issue.description[:500]}..." if len(issue.description) > 500 else f"Description: {issue.description}")
 
-                    pdf.chapter_body(f"AI Analysis:\n{issue['ai_analysis']}")
+                    pdf.chapter_body(f"AI Analysis:\n{issue.ai_analysis}")
                     pdf.ln(5)
 
         # Save the PDF
@@ -322,17 +706,22 @@ class JiraDocumentationGenerator:
     def run(self):
         """Run the complete documentation generation process"""
         try:
+            # Skip the issues an interrupted run already analyzed
+            analyzed_keys = self.load_checkpoint()
+
             # 1. Get all issues
             issues = self.get_all_issues()
 
             # 2. Extract data including comments
-            issue_data = self.extract_issue_data(issues)
+            issue_data = (issue for issue in self.extract_issue_data(issues) if issue.key not in analyzed_keys)
 
-            # 3. Analyze with AI
-            analyzed_data = self.analyze_with_ai(issue_data)
+            # 3. Analyze with AI, streaming the results to the analysis file
+            with open(self.analysis_path, 'ab') as analysis_file:
+                for issue in self.analyze_with_ai(issue_data):
+                    analysis_file.write(orjson.dumps(issue) + b'\n')
 
             # 4. Categorize issues
-            categorized_data = self.categorize_issues(analyzed_data)
+            categorized_data = self.categorize_issues()
 
             # 5. Generate documentation
             documentation = self.generate_documentation(categorized_data)
@@ -340,6 +729,9 @@ class JiraDocumentationGenerator:
             # 6. Generate PDF
             pdf_path = self.generate_pdf(documentation)
 
+            # The run is complete, the next one starts from scratch
+            os.remove(self.analysis_path)
+
             print("Documentation generation complete!")
             return pdf_path
 
@@ -348,11 +740,22 @@ class JiraDocumentationGenerator:
             return None
 
 
+def positive_int(value):
+    """argparse type for the options that need a number of at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Generate documentation from Jira project')
     parser.add_argument('--project', required=True, help='Jira project key')
-    parser.add_argument('--model', default='deepseek-r1:7b', help='Ollama model to use (default:deepseek-r1:7b)')
+    parser.add_argument('--model', default='llama3.2:3b-instruct-q4_K_M', help='Ollama model to use (default: llama3.2:3b-instruct-q4_K_M)')
     parser.add_argument('--ollama-url', default='http://localhost:11434', help='URL for Ollama API (default: http://localhost:11434)')
+    parser.add_argument('--page-size', type=positive_int, default=1000, help='Number of issues to request per Jira page (default: 1000)')
+    parser.add_argument('--batch-size', type=positive_int, default=4, help='Number of small issues to analyze per Ollama call, 1 disables batching (default: 4)')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore the cache of previous Ollama responses in output/.ai_cache.sqlite')
     args = parser.parse_args()
 
     # Load credentials from environment variables
@@ -372,7 +775,10 @@ if __name__ == "__main__":
         jira_email=jira_email,
         project_key=args.project,
         ollama_url=args.ollama_url,
-        model_name=args.model
+        model_name=args.model,
+        page_size=args.page_size,
+        batch_size=args.batch_size,
+        use_cache=not args.no_cache
     )
 
     generator.run()
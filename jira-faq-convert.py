@@ -1,5 +1,9 @@
 import requests
-import json
+import orjson
+import hashlib
+import sqlite3
+import threading
+import time
 from jira import JIRA
 import pandas as pd
 import os
@@ -9,13 +13,105 @@ from dotenv import load_dotenv
 import re
 import argparse
 from tqdm import tqdm
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import ReadTimeoutError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from itertools import islice
+from dataclasses import dataclass, field
 
 # Load environment variables
 load_dotenv()
 
+# Token budget for the issue content of a single prompt
+ISSUE_TOKEN_BUDGET = 4096
+
+# Context window requested from Ollama, sized for a full batch of small issues plus the responses
+# rather than the model's maximum, which keeps the KV cache small
+OLLAMA_NUM_CTX = 8192
+
+# Maximum number of tokens generated per issue, its JSON answer is short
+SOLUTION_NUM_PREDICT = 256
+
+# Sampling temperature of the solution extraction, kept low for factual answers
+SOLUTION_TEMPERATURE = 0.2
+
+# Issues whose prompt text is at most this many tokens are batched together for the solution extraction
+SMALL_ISSUE_TOKENS = ISSUE_TOKEN_BUDGET // 4
+
+# Approximates the model tokenizer: CJK characters are about one token each, other text
+# about one token per short word chunk or punctuation mark
+TOKEN_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]|\w{1,6}|[^\w\s]')
+
+# Issues with a shorter prompt text than this are too thin to contain a solution
+MIN_ISSUE_CHARS = 200
+
+# Statuses of issues nobody worked on yet, so no solution can exist
+UNRESOLVED_STATUSES = ('open', 'to do', 'backlog')
+
+# The system prompt is kept constant across calls so Ollama can reuse the cached prompt prefix
+SOLUTION_SYSTEM_PROMPT = """You are a technical documentation assistant that analyzes Jira issues and comments.
+
+Read every Jira issue you are given carefully including its description and ALL comments.
+For each issue:
+
+1. Determine if there is a clear SOLUTION to the problem described in the ticket. The solution could be in the description or in any of the comments.
+2. If a solution exists, extract and summarize it clearly."""
+
+# Matches a response that already told us there is no solution, the rest of the generation can be skipped
+NO_SOLUTION_PATTERN = re.compile(r'"has_solution"\s*:\s*false')
+
+# JSON schema of the answer for one issue, has_solution comes first so a missing solution is known early
+SOLUTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "has_solution": {"type": "boolean"},
+        "solution_summary": {"type": "string"},
+        "solution_details": {"type": "string"},
+        "confidence": {"type": "string", "enum": ["high", "medium", "low"]}
+    },
+    "required": ["has_solution", "solution_summary", "solution_details", "confidence"]
+}
+
+# Attempts at an Ollama request before giving up, on top of the HTTP level retries of the session
+OLLAMA_ATTEMPTS = 3
+
+# Seconds to wait before the second attempt at an Ollama request, doubled for each further attempt
+OLLAMA_RETRY_BACKOFF = 2
+
+
+@dataclass(slots=True)
+class CommentRecord:
+    """The fields of a Jira comment used in the prompts"""
+    author: str
+    body: str
+    created: str
+
+
+@dataclass(slots=True)
+class IssueRecord:
+    """The fields of a Jira issue used downstream, and the result of its analysis"""
+    key: str
+    summary: str
+    description: str
+    status: str
+    issue_type: str
+    updated: str
+    comments: list = field(default_factory=list)
+    solution: dict | None = None
+    analysis_failed: bool = False
+
+    @classmethod
+    def from_json(cls, line):
+        """Rebuild an issue from its line in the JSONL output"""
+        data = orjson.loads(line)
+        data['comments'] = [CommentRecord(**comment) for comment in data['comments']]
+        return cls(**data)
+
 
 class JiraSolutionExtractor:
-    def __init__(self, jira_url, jira_token, jira_email, project_key, ollama_url="http://localhost:11434", model_name="llama3.2:latest"):
+    def __init__(self, jira_url, jira_token, jira_email, project_key, ollama_url="http://localhost:11434", model_name="llama3.2:latest", page_size=1000, batch_size=4, use_cache=True):
         """Initialize the Jira Solution Extractor with credentials and project info"""
         self.jira_url = jira_url
         self.jira_token = jira_token
@@ -23,6 +119,22 @@ class JiraSolutionExtractor:
         self.project_key = project_key
         self.ollama_url = ollama_url
         self.model_name = model_name
+        self.page_size = page_size
+        self.batch_size = batch_size
+
+        # Ollama handles OLLAMA_NUM_PARALLEL requests at once, match it with our worker count
+        self.num_parallel = int(os.getenv('OLLAMA_NUM_PARALLEL', 4))
+
+        # Limits the requests in flight so a cold loading model isn't hit by every worker at once
+        self.ollama_slots = threading.Semaphore(self.num_parallel)
+
+        # Shared session so the Ollama calls reuse their connections, retrying with backoff while the server is overloaded.
+        # Read errors aren't retried, Ollama only answers once the generation is done so it would start all over.
+        self.session = requests.Session()
+        retry = Retry(total=5, read=False, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods={'POST'})
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
         # Initialize Jira client
         self.jira = JIRA(
@@ -34,227 +146,546 @@ class JiraSolutionExtractor:
         if not os.path.exists('output'):
             os.makedirs('output')
 
+        # Extracted solutions are streamed to this file, it doubles as a checkpoint to resume an interrupted run
+        self.solutions_path = os.path.join('output', f"solutions_{self.project_key}.jsonl")
+
+        # Cache of Ollama responses so reruns don't send identical prompts again
+        self.cache = None
+        self.cache_lock = threading.Lock()
+        if use_cache:
+            self.cache = sqlite3.connect(os.path.join('output', '.ai_cache.sqlite'), check_same_thread=False)
+            self.cache.execute('PRAGMA journal_mode=WAL')
+            self.cache.execute('CREATE TABLE IF NOT EXISTS prompt_cache (prompt_hash TEXT PRIMARY KEY, response TEXT)')
+            # Per issue results, so reruns only analyze new or updated issues even when they were batched differently
+            self.cache.execute(
+                'CREATE TABLE IF NOT EXISTS issue_analyses (key TEXT, updated TEXT, model TEXT, prompt_hash TEXT, response TEXT, '
+                'PRIMARY KEY (key, updated, model, prompt_hash))'
+            )
+
     def get_all_issues(self):
-        """Fetch all issues for the given project"""
+        """Fetch all issues for the given project, yielding them a page at a time"""
         print(f"Fetching issues for project {self.project_key}...")
-        issues = []
 
         # Use JQL to query all issues for the project
         jql_str = f'project = {self.project_key} ORDER BY created DESC'
 
+        # Only request the fields we actually use to keep the payloads small.
+        # Comments are included so they don't need a request per issue.
+        fields = 'summary,description,status,issuetype,updated,comment'
+
         # Get issues with pagination (Jira API limits results)
-        start_at = 0
-        max_results = 100
-        total = 100  # Initial value to start the loop
+        max_results = self.page_size
+
+        def fetch_page(start_at):
+            return self.jira.search_issues(jql_str, startAt=start_at, maxResults=max_results, fields=fields)
 
         with tqdm(desc="Fetching issues", unit="issues") as pbar:
-            while start_at < total:
-                results = self.jira.search_issues(jql_str, startAt=start_at, maxResults=max_results)
+            # The first page also tells us how many issues there are in total
+            first_page = fetch_page(0)
+            total = first_page.total
+            pbar.total = total
+            pbar.update(len(first_page))
+            yield first_page
+
+            # Jira silently caps maxResults, so fall back to the page size the server returned
+            if 0 < len(first_page) < max_results and len(first_page) < total:
+                print(f"Warning: Jira returned {len(first_page)} issues per page instead of {max_results}, using the smaller page size")
+                max_results = len(first_page)
+
+            # Fetch the remaining pages concurrently, each request mostly waits on Jira.
+            # The client's requests.Session is safe to share for independent requests.
+            # Only a few pages are fetched ahead so they don't pile up in memory while
+            # the rest of the pipeline works through them.
+            max_workers = 8
+            pending_pages = deque()
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for start_at in range(max_results, total, max_results):
+                    pending_pages.append(executor.submit(fetch_page, start_at))
+                    if len(pending_pages) == max_workers:
+                        results = pending_pages.popleft().result()
+                        pbar.update(len(results))
+                        yield results
+
+                while pending_pages:
+                    results = pending_pages.popleft().result()
+                    pbar.update(len(results))
+                    yield results
+
+    def extract_issue_data(self, pages):
+        """Extract relevant data from pages of issues including comments, yielding one issue at a time"""
+        print("Extracting data from issues and comments...")
 
-                if start_at == 0:
-                    total = results.total
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            for issues in pages:
+                # Comments come back inline with the search results. Only issues with more
+                # comments than the search embeds need a separate (concurrent) request.
+                overflow_futures = {
+                    issue.key: executor.submit(self.jira.comments, issue)
+                    for issue in issues
+                    if issue.fields.comment.total > len(issue.fields.comment.comments)
+                }
 
-                issues.extend(results)
-                start_at += len(results)
-                pbar.update(len(results))
-                pbar.total = total
+                for issue in issues:
+                    # Get basic issue info
+                    issue_info = IssueRecord(
+                        key=issue.key,
+                        summary=issue.fields.summary,
+                        description=issue.fields.description or "",
+                        status=issue.fields.status.name,
+                        issue_type=issue.fields.issuetype.name,
+                        updated=issue.fields.updated
+                    )
+
+                    # Get comments
+                    if issue.key in overflow_futures:
+                        comments = overflow_futures[issue.key].result()
+                    else:
+                        comments = issue.fields.comment.comments
+                    for comment in comments:
+                        issue_info.comments.append(CommentRecord(
+                            author=comment.author.displayName,
+                            body=comment.body,
+                            created=comment.created
+                        ))
+
+                    yield issue_info
+
+    def get_cached_response(self, prompt_hash):
+        """Return the cached Ollama response for a prompt hash, or None"""
+        if self.cache is None:
+            return None
 
-        return issues
+        with self.cache_lock:
+            row = self.cache.execute('SELECT response FROM prompt_cache WHERE prompt_hash = ?', (prompt_hash,)).fetchone()
+        return row[0] if row else None
 
-    def get_comments_for_issue(self, issue):
-        """Fetch all comments for a given issue"""
-        comments = self.jira.comments(issue)
-        return comments
+    def store_cached_response(self, prompt_hash, response):
+        """Store an Ollama response in the cache"""
+        if self.cache is None:
+            return
 
-    def extract_issue_data(self, issues):
-        """Extract relevant data from issues including comments"""
-        print("Extracting data from issues and comments...")
-        issue_data = []
-
-        with tqdm(total=len(issues), desc="Processing issues") as pbar:
-            for issue in issues:
-                # Get basic issue info
-                issue_info = {
-                    'key': issue.key,
-                    'summary': issue.fields.summary,
-                    'description': issue.fields.description or "",
-                    'status': issue.fields.status.name,
-                    'issue_type': issue.fields.issuetype.name,
-                    'created': issue.fields.created,
-                    'updated': issue.fields.updated,
-                    'comments': []
-                }
+        with self.cache_lock, self.cache:
+            self.cache.execute('INSERT OR REPLACE INTO prompt_cache (prompt_hash, response) VALUES (?, ?)', (prompt_hash, response))
+
+    def solution_cache_key(self, issue, issue_text):
+        """Return the cache key of an issue's solution, it changes with the issue, the model, the prompt and the generation options"""
+        prompt = f"{SOLUTION_TEMPERATURE}\0{SOLUTION_NUM_PREDICT}\0{OLLAMA_NUM_CTX}\0{SOLUTION_SCHEMA}\0{SOLUTION_SYSTEM_PROMPT}\0{self.build_solution_prompt(issue_text)}"
+        prompt_hash = hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+        return issue.key, issue.updated, self.model_name, prompt_hash
+
+    def get_cached_solution(self, issue, issue_text):
+        """Return the cached solution of an issue as JSON ('null' when it has none), or None when it isn't cached"""
+        if self.cache is None:
+            return None
 
-                # Get comments
-                comments = self.get_comments_for_issue(issue)
-                for comment in comments:
-                    issue_info['comments'].append({
-                        'author': comment.author.displayName,
-                        'body': comment.body,
-                        'created': comment.created
-                    })
+        with self.cache_lock:
+            row = self.cache.execute(
+                'SELECT response FROM issue_analyses WHERE key = ? AND updated = ? AND model = ? AND prompt_hash = ?',
+                self.solution_cache_key(issue, issue_text)
+            ).fetchone()
+        return row[0] if row else None
+
+    def store_cached_solution(self, issue, issue_text):
+        """Store the solution found for an issue, or the lack of one, in the cache"""
+        if self.cache is None:
+            return
+
+        with self.cache_lock, self.cache:
+            self.cache.execute(
+                'INSERT OR REPLACE INTO issue_analyses (key, updated, model, prompt_hash, response) VALUES (?, ?, ?, ?, ?)',
+                (*self.solution_cache_key(issue, issue_text), orjson.dumps(issue.solution).decode())
+            )
+
+    def stream_ollama(self, api_url, payload, stop_predicate):
+        """Stream a response from Ollama, stopping as soon as stop_predicate matches the text received so far"""
+        response_text = ""
+
+        with self.session.post(api_url, json=payload, timeout=(5, 600), stream=True) as response:
+            response.raise_for_status()  # Raise exception for 4XX/5XX responses
+            for line in response.iter_lines():
+                if not line:
+                    continue
+
+                chunk = orjson.loads(line)
+                response_text += chunk.get('message', {}).get('content', '')
+                # Leaving the block closes the connection, which makes Ollama stop generating
+                if chunk.get('done') or stop_predicate(response_text):
+                    break
 
-                issue_data.append(issue_info)
-                pbar.update(1)
+        return response_text
 
-        return issue_data
+    def call_ollama(self, prompt, temperature=SOLUTION_TEMPERATURE, system=SOLUTION_SYSTEM_PROMPT, num_predict=SOLUTION_NUM_PREDICT, response_format=None, stop_predicate=None):
+        """Call the local Ollama model for analysis.
 
-    def call_ollama(self, prompt, temperature=0.2):
-        """Call the local Ollama model for analysis"""
-        api_url = f"{self.ollama_url}/api/generate"
+        response_format ("json" or a JSON schema) constrains the output, a stop_predicate streams the response and stops it early. Raises the last error when every attempt failed.
+        """
+        api_url = f"{self.ollama_url}/api/chat"
+
+        prompt_hash = hashlib.sha256(f"{self.model_name}\0{temperature}\0{num_predict}\0{response_format}\0{system}\0{prompt}".encode()).hexdigest()
+        cached_response = self.get_cached_response(prompt_hash)
+        if cached_response is not None:
+            return cached_response
 
         payload = {
             "model": self.model_name,
-            "prompt": prompt,
-            "temperature": temperature,
-            "stream": False
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            "options": {
+                "temperature": temperature,
+                "num_ctx": OLLAMA_NUM_CTX,
+                "num_predict": num_predict
+            },
+            "stream": stop_predicate is not None
         }
 
+        if response_format is not None:
+            payload["format"] = response_format
+
+        for attempt in range(OLLAMA_ATTEMPTS):
+            try:
+                with self.ollama_slots:
+                    if stop_predicate is not None:
+                        result = self.stream_ollama(api_url, payload, stop_predicate)
+                    else:
+                        # Connect quickly or fail, but give the model plenty of time to generate
+                        response = self.session.post(api_url, json=payload, timeout=(5, 600))
+                        response.raise_for_status()  # Raise exception for 4XX/5XX responses
+                        result = orjson.loads(response.content).get('message', {}).get('content', '')
+                break
+            except requests.RequestException as e:
+                # The generation outlasted the read timeout, running it again would take as long.
+                # requests reports a timeout while reading a streamed body as a ConnectionError.
+                timed_out = isinstance(e, requests.ReadTimeout) or bool(e.args) and isinstance(e.args[0], ReadTimeoutError)
+                if timed_out or attempt == OLLAMA_ATTEMPTS - 1:
+                    raise
+                print(f"Error calling Ollama API, retrying: {str(e)}")
+                time.sleep(OLLAMA_RETRY_BACKOFF * 2 ** attempt)
+
+        if response_format is not None:
+            try:
+                orjson.loads(result)
+            except orjson.JSONDecodeError:
+                # The structured answer was cut off at num_predict or by the stop_predicate, leave it out of the cache
+                return result
+
+        self.store_cached_response(prompt_hash, result)
+        return result
+
+    def estimate_tokens(self, text):
+        """Estimate the number of model tokens in a text"""
+        return len(TOKEN_PATTERN.findall(text))
+
+    def truncate_to_tokens(self, text, max_tokens):
+        """Cut a text after its first max_tokens estimated tokens"""
+        for count, match in enumerate(TOKEN_PATTERN.finditer(text), 1):
+            if count == max_tokens:
+                return text[:match.end()]
+        return text
+
+    def build_issue_text(self, issue):
+        """Prepare the text describing an issue and its comments for the AI prompts"""
+        # Leave room for the comments, they usually hold the actual solution
+        description_budget = ISSUE_TOKEN_BUDGET // 2 if issue.comments else ISSUE_TOKEN_BUDGET
+        description = issue.description
+        if self.estimate_tokens(description) > description_budget:
+            description = self.truncate_to_tokens(description, description_budget) + "... (truncated)"
+
+        issue_text = f"Issue: {issue.key} - {issue.summary}\n"
+        issue_text += f"Description: {description}\n"
+        issue_text += f"Status: {issue.status}\n"
+        issue_text += f"Type: {issue.issue_type}\n\n"
+
+        # Add comments from newest to oldest until the token budget is used up
+        remaining_tokens = ISSUE_TOKEN_BUDGET - self.estimate_tokens(issue_text)
+        comment_texts = []
+        for comment in reversed(issue.comments):
+            comment_text = f"- {comment.author} ({comment.created}): {comment.body}\n\n"
+            comment_tokens = self.estimate_tokens(comment_text)
+            if comment_tokens > remaining_tokens:
+                # Keep at least the start of the newest comment
+                if not comment_texts and remaining_tokens > 0:
+                    comment_texts.append(self.truncate_to_tokens(comment_text, remaining_tokens) + "... (truncated)\n\n")
+                break
+            comment_texts.append(comment_text)
+            remaining_tokens -= comment_tokens
+
+        if comment_texts:
+            issue_text += "Comments:\n"
+            omitted = len(issue.comments) - len(comment_texts)
+            if omitted:
+                issue_text += f"({omitted} older comments omitted)\n\n"
+            issue_text += "".join(reversed(comment_texts))
+
+        return issue_text
+
+    def can_have_solution(self, issue, issue_text):
+        """Check whether an issue carries enough information to possibly contain a solution"""
+        if not issue.description.strip() and not issue.comments:
+            return False
+        if issue.status.lower() in UNRESOLVED_STATUSES:
+            return False
+        return len(issue_text) >= MIN_ISSUE_CHARS
+
+    def group_issues(self, issue_data):
+        """Group the issues that can have a solution and aren't cached into batches of (issue, issue_text) pairs, large issues get a batch of their own"""
+        batches = []
+        pending = []
+
+        for issue in issue_data:
+            issue_text = self.build_issue_text(issue)
+            if not self.can_have_solution(issue, issue_text):
+                continue
+
+            # Reuse the result of issues that didn't change since a previous run
+            cached_solution = self.get_cached_solution(issue, issue_text)
+            if cached_solution is not None:
+                solution = orjson.loads(cached_solution)
+                if solution:
+                    issue.solution = solution
+                continue
+
+            if self.batch_size > 1 and self.estimate_tokens(issue_text) <= SMALL_ISSUE_TOKENS:
+                pending.append((issue, issue_text))
+                if len(pending) == self.batch_size:
+                    batches.append(pending)
+                    pending = []
+            else:
+                batches.append([(issue, issue_text)])
+
+        if pending:
+            batches.append(pending)
+
+        return batches
+
+    def record_solution(self, issue, solution_data):
+        """Attach the solution found by the model to the issue if it is a valid one"""
+        if solution_data.get('has_solution') and solution_data.get('confidence') != 'low':
+            issue.solution = {
+                'summary': solution_data.get('solution_summary', 'No summary provided'),
+                'details': solution_data.get('solution_details', 'No details provided'),
+                'confidence': solution_data.get('confidence', 'medium')
+            }
+
+    def build_solution_prompt(self, issue_text):
+        """Build the prompt to look for a solution in a single issue"""
+        return f"""
+        Read the following Jira issue.
+
+        Respond in JSON format with these fields:
+        {{
+          "has_solution": true/false,
+          "solution_summary": "Brief summary of the solution (if found)",
+          "solution_details": "Detailed explanation of the solution (if found)",
+          "confidence": "high/medium/low (how confident you are that this is a real solution)"
+        }}
+
+        The issue:
+        {issue_text}
+        """
+
+    def extract_solution(self, issue, issue_text):
+        """Use Ollama to look for a solution in a single issue"""
         try:
-            response = requests.post(api_url, json=payload)
-            response.raise_for_status()  # Raise exception for 4XX/5XX responses
-            return response.json().get('response', '')
+            # Call Ollama API, stopping early once the model says there is no solution
+            analysis = self.call_ollama(self.build_solution_prompt(issue_text), response_format=SOLUTION_SCHEMA, stop_predicate=NO_SOLUTION_PATTERN.search)
+
+            # Try to parse the JSON response
+            if not NO_SOLUTION_PATTERN.search(analysis):
+                try:
+                    self.record_solution(issue, orjson.loads(analysis))
+                except (orjson.JSONDecodeError, AttributeError) as je:
+                    # If JSON parsing fails (e.g. the answer hit num_predict), assume there might be a solution
+                    issue.solution = {
+                        'summary': "Solution may exist, but couldn't parse automatically",
+                        'details': analysis[:500],  # Truncate to avoid excessive text
+                        'confidence': 'low'
+                    }
+                    print(f"Warning: Couldn't parse JSON for issue {issue.key}: {str(je)}")
+                    # Only cache real answers, the next run asks the model again
+                    return
+
+            self.store_cached_solution(issue, issue_text)
+
         except Exception as e:
-            print(f"Error calling Ollama API: {str(e)}")
-            return f"Error analyzing with Ollama: {str(e)}"
+            print(f"Error analyzing issue {issue.key}: {str(e)}")
+            issue.analysis_failed = True
+
+    def extract_batch_solutions(self, batch):
+        """Use Ollama to look for solutions in a batch of issues with a single call, falling back to one call per issue when the answer can't be used"""
+        if len(batch) == 1:
+            self.extract_solution(*batch[0])
+            return
+
+        issues_text = "\n\n".join(f"=== ISSUE {issue.key} ===\n{issue_text}" for issue, issue_text in batch)
+
+        prompt = f"""
+        Read each of the following Jira issues and analyze them independently.
+
+        Respond with a single JSON object that has one entry per issue, keyed by the issue key:
+        {{
+          "ISSUE-KEY": {{
+            "has_solution": true/false,
+            "solution_summary": "Brief summary of the solution (if found)",
+            "solution_details": "Detailed explanation of the solution (if found)",
+            "confidence": "high/medium/low (how confident you are that this is a real solution)"
+          }}
+        }}
+
+        The issues:
+        {issues_text}
+        """
+
+        # Constrain the response to an object with exactly the issue keys of the batch
+        keys = [issue.key for issue, _ in batch]
+        response_schema = {
+            "type": "object",
+            "properties": {key: SOLUTION_SCHEMA for key in keys},
+            "required": keys
+        }
+
+        try:
+            solutions = orjson.loads(self.call_ollama(prompt, num_predict=SOLUTION_NUM_PREDICT * len(batch), response_format=response_schema))
+            # Make sure every issue of the batch got an answer before using any of them
+            batch_solutions = [solutions[key] for key in keys]
+            for solution_data in batch_solutions:
+                if not isinstance(solution_data, dict):
+                    raise TypeError(f"unexpected solution entry {solution_data!r}")
+        except requests.RequestException as e:
+            # Ollama is unreachable, one call per issue would only fail more slowly
+            print(f"Error analyzing a batch of {len(batch)} issues: {str(e)}")
+            for issue, _ in batch:
+                issue.analysis_failed = True
+            return
+        except (orjson.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"Warning: Couldn't parse batched solutions, analyzing {len(batch)} issues individually: {str(e)}")
+            for issue, issue_text in batch:
+                self.extract_solution(issue, issue_text)
+            return
+
+        for (issue, issue_text), solution_data in zip(batch, batch_solutions):
+            self.record_solution(issue, solution_data)
+            self.store_cached_solution(issue, issue_text)
+
+    def extract_window(self, executor, issues, pbar):
+        """Extract the solutions of a window of issues concurrently, returns once all of them are analyzed"""
+        # Issues that can't have a solution or have a cached one are left out of the batches
+        batches = self.group_issues(issues)
+        pbar.update(len(issues) - sum(len(batch) for batch in batches))
+
+        # Small issues are analyzed several at a time to amortize the prompt overhead,
+        # and the batches are sent concurrently to keep every Ollama slot busy
+        futures = {executor.submit(self.extract_batch_solutions, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            future.result()
+            pbar.update(len(futures[future]))
 
     def extract_solutions(self, issue_data):
-        """Use Ollama to analyze the issues and comments to identify solutions"""
+        """Use Ollama to analyze the issues and comments to identify solutions, yielding every analyzed issue"""
         print(f"Analyzing issues and comments with Ollama model {self.model_name} to extract solutions...")
-        issues_with_solutions = []
-
-        with tqdm(total=len(issue_data), desc="Solution extraction") as pbar:
-            for issue in issue_data:
-                # Prepare the text for analysis
-                issue_text = f"Issue: {issue['key']} - {issue['summary']}\n"
-                issue_text += f"Description: {issue['description']}\n"
-                issue_text += f"Status: {issue['status']}\n"
-                issue_text += f"Type: {issue['issue_type']}\n\n"
-
-                if issue['comments']:
-                    issue_text += "Comments:\n"
-                    for comment in issue['comments']:
-                        issue_text += f"- {comment['author']} ({comment['created']}): {comment['body']}\n\n"
-
-                # Skip if issue is too large (to avoid token limits)
-                if len(issue_text) > 8000:
-                    issue_text = issue_text[:8000] + "... (truncated)"
-
-                # Define the prompt for the AI to extract solutions
-                prompt = f"""
-                You are a technical documentation assistant that analyzes Jira issues and comments.
-
-                Read the following Jira issue carefully including its description and ALL comments.
-                Your task is to:
-
-                1. Determine if there is a clear SOLUTION to the problem described in the ticket. The solution could be in the description or in any of the comments.
-                2. If a solution exists, extract and summarize it clearly.
-                3. If NO solution exists, simply state "NO_SOLUTION_FOUND".
-
-                Respond in JSON format with these fields:
-                {{
-                  "has_solution": true/false,
-                  "solution_summary": "Brief summary of the solution (if found)",
-                  "solution_details": "Detailed explanation of the solution (if found)",
-                  "confidence": "high/medium/low (how confident you are that this is a real solution)"
-                }}
-
-                The issue:
-                {issue_text}
-                """
 
-                try:
-                    # Call Ollama API
-                    analysis = self.call_ollama(prompt)
-
-                    # Try to parse the JSON response
-                    try:
-                        # Clean up the response to handle potential formatting issues
-                        analysis_text = analysis.strip()
-                        # Find JSON content within triple backticks if present
-                        json_match = re.search(r'```json\s*(.*?)\s*```', analysis_text, re.DOTALL)
-                        if json_match:
-                            analysis_text = json_match.group(1)
-                        else:
-                            # Find JSON content within any backticks if present
-                            json_match = re.search(r'```\s*(.*?)\s*```', analysis_text, re.DOTALL)
-                            if json_match:
-                                analysis_text = json_match.group(1)
-
-                        solution_data = json.loads(analysis_text)
-
-                        # Check if we have a valid solution
-                        if solution_data.get('has_solution') and solution_data.get('confidence') != 'low':
-                            # Add the solution information to the issue data
-                            issue['solution'] = {
-                                'summary': solution_data.get('solution_summary', 'No summary provided'),
-                                'details': solution_data.get('solution_details', 'No details provided'),
-                                'confidence': solution_data.get('confidence', 'medium')
-                            }
-                            issues_with_solutions.append(issue)
-                    except (json.JSONDecodeError, AttributeError) as je:
-                        # If JSON parsing fails, try to determine if solution exists through text analysis
-                        if "NO_SOLUTION_FOUND" not in analysis:
-                            # Assume there might be a solution
-                            issue['solution'] = {
-                                'summary': "Solution may exist, but couldn't parse automatically",
-                                'details': analysis[:500],  # Truncate to avoid excessive text
-                                'confidence': 'low'
-                            }
-                            issues_with_solutions.append(issue)
-                        print(f"Warning: Couldn't parse JSON for issue {issue['key']}: {str(je)}")
-
-                except Exception as e:
-                    print(f"Error analyzing issue {issue['key']}: {str(e)}")
-
-                pbar.update(1)
-
-        return issues_with_solutions
-
-    def generate_faq_documentation(self, issues_with_solutions):
+        # Only a window of issues is held in memory at a time, large enough to keep Ollama busy
+        window_size = self.num_parallel * self.batch_size * 4
+        issue_iter = iter(issue_data)
+
+        with ThreadPoolExecutor(max_workers=self.num_parallel) as executor, tqdm(desc="Solution extraction", unit="issues") as pbar:
+            while window := list(islice(issue_iter, window_size)):
+                self.extract_window(executor, window, pbar)
+                yield from window
+
+    def collect_solutions(self):
+        """Group the issues with a solution by issue type, returning their offsets in the solutions file and the number of analyzed issues"""
+        solutions_by_type = {}
+        analyzed_count = 0
+        offset = 0
+        with open(self.solutions_path, 'rb') as solutions_file:
+            for line in solutions_file:
+                issue = orjson.loads(line)
+                analyzed_count += 1
+                if issue['solution'] is not None:
+                    solutions_by_type.setdefault(issue['issue_type'], []).append(offset)
+                offset += len(line)
+
+        return solutions_by_type, analyzed_count
+
+    def read_issues(self, offsets):
+        """Read analyzed issues back from the solutions file at the given offsets"""
+        with open(self.solutions_path, 'rb') as solutions_file:
+            for offset in offsets:
+                solutions_file.seek(offset)
+                yield IssueRecord.from_json(solutions_file.readline())
+
+    def load_checkpoint(self):
+        """Return the keys of the issues an interrupted run already analyzed successfully"""
+        if not os.path.exists(self.solutions_path):
+            return set()
+
+        analyzed_keys = set()
+        kept_path = self.solutions_path + '.tmp'
+        with open(self.solutions_path, 'rb') as solutions_file, open(kept_path, 'wb') as kept_file:
+            for line in solutions_file:
+                # A killed run can leave a partially written last line behind
+                if not line.endswith(b'\n'):
+                    break
+                issue = orjson.loads(line)
+                # Issues whose analysis failed are dropped so they are analyzed again
+                if issue.get('analysis_failed'):
+                    continue
+                analyzed_keys.add(issue['key'])
+                kept_file.write(line)
+        os.replace(kept_path, self.solutions_path)
+
+        if analyzed_keys:
+            print(f"Resuming previous run, {len(analyzed_keys)} issues were already analyzed")
+        return analyzed_keys
+
+    def generate_faq_documentation(self, solutions_by_type):
         """Generate FAQ-style documentation from issues with solutions"""
-        print(f"Generating FAQ documentation for {len(issues_with_solutions)} issues with solutions...")
+        solution_count = sum(len(offsets) for offsets in solutions_by_type.values())
+        print(f"Generating FAQ documentation for {solution_count} issues with solutions...")
 
-        if not issues_with_solutions:
+        if not solution_count:
             print("No issues with solutions found. No documentation will be generated.")
             return None
 
         class PDF(FPDF):
             def header(self):
-                self.set_font('Arial', 'B', 12)
-                self.cell(0, 10, f"Solution FAQ for {self.project_key}", 0, 1, 'C')
+                self.set_font('Helvetica', 'B', 12)
+                self.cell(0, 10, f"Solution FAQ for {self.project_key}", align='C', new_x="LMARGIN", new_y="NEXT")
                 self.ln(5)
 
             def footer(self):
                 self.set_y(-15)
-                self.set_font('Arial', 'I', 8)
-                self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+                self.set_font('Helvetica', 'I', 8)
+                self.cell(0, 10, f'Page {self.page_no()}', align='C')
 
             def chapter_title(self, title):
-                self.set_font('Arial', 'B', 14)
+                self.set_font('Helvetica', 'B', 14)
                 self.set_fill_color(200, 220, 255)
-                self.cell(0, 10, title, 0, 1, 'L', 1)
+                self.cell(0, 10, title, align='L', fill=True, new_x="LMARGIN", new_y="NEXT")
                 self.ln(5)
 
             def chapter_body(self, body):
-                self.set_font('Arial', '', 11)
-                self.multi_cell(0, 5, body)
+                self.set_font('Helvetica', '', 11)
+                self.multi_cell(0, 5, body, new_x="LMARGIN", new_y="NEXT")
                 self.ln()
 
             def section_title(self, title):
-                self.set_font('Arial', 'B', 12)
-                self.cell(0, 8, title, 0, 1, 'L')
+                self.set_font('Helvetica', 'B', 12)
+                self.cell(0, 8, title, align='L', new_x="LMARGIN", new_y="NEXT")
                 self.ln(3)
 
         pdf = PDF()
+        pdf.set_auto_page_break(auto=True, margin=15)
         pdf.project_key = self.project_key
         pdf.add_page()
 
         # Add title
-        pdf.set_font('Arial', 'B', 16)
-        pdf.cell(0, 10, f"Solution FAQ for Project: {self.project_key}", 0, 1, 'C')
-        pdf.set_font('Arial', 'I', 10)
-        pdf.cell(0, 10, f"Generated on {datetime.now().strftime('%Y-%m-%d %H:%M')}", 0, 1, 'C')
+        pdf.set_font('Helvetica', 'B', 16)
+        pdf.cell(0, 10, f"Solution FAQ for Project: {self.project_key}", align='C', new_x="LMARGIN", new_y="NEXT")
+        pdf.set_font('Helvetica', 'I', 10)
+        pdf.cell(0, 10, f"Generated on {datetime.now().strftime('%Y-%m-%d %H:%M')}", align='C', new_x="LMARGIN", new_y="NEXT")
         pdf.ln(10)
 
         # Add introduction
@@ -266,38 +697,30 @@ class JiraSolutionExtractor:
         )
         pdf.ln(10)
 
-        # Organize solutions by issue type
-        solutions_by_type = {}
-        for issue in issues_with_solutions:
-            issue_type = issue['issue_type']
-            if issue_type not in solutions_by_type:
-                solutions_by_type[issue_type] = []
-            solutions_by_type[issue_type].append(issue)
-
         # Add solutions by category
-        for issue_type, issues in solutions_by_type.items():
+        for issue_type, offsets in solutions_by_type.items():
             pdf.add_page()
             pdf.chapter_title(f"{issue_type} Solutions")
 
-            for issue in issues:
-                pdf.section_title(f"Q: {issue['summary']}")
+            for issue in self.read_issues(offsets):
+                pdf.section_title(f"Q: {issue.summary}")
 
                 # Add problem context (from description)
-                description_preview = issue['description'][:300] + "..." if len(issue['description']) > 300 else issue['description']
+                description_preview = issue.description[:300] + "..." if len(issue.description) > 300 else issue.description
                 if description_preview:
                     pdf.chapter_body(f"Context: {description_preview}")
 
                 # Add solution
-                pdf.chapter_body(f"A: {issue['solution']['summary']}")
+                pdf.chapter_body(f"A: {issue.solution['summary']}")
 
                 # Add more detailed solution if available
-                if issue['solution'].get('details') and issue['solution']['details'] != issue['solution']['summary']:
-                    pdf.chapter_body(f"Details: {issue['solution']['details']}")
+                if issue.solution.get('details') and issue.solution['details'] != issue.solution['summary']:
+                    pdf.chapter_body(f"Details: {issue.solution['details']}")
 
                 # Add ticket reference
-                pdf.set_font('Arial', 'I', 10)
-                pdf.chapter_body(f"Reference: {issue['key']} (Confidence: {issue['solution']['confidence']})")
-                pdf.set_font('Arial', '', 11)
+                pdf.set_font('Helvetica', 'I', 10)
+                pdf.chapter_body(f"Reference: {issue.key} (Confidence: {issue.solution['confidence']})")
+                pdf.set_font('Helvetica', '', 11)
 
                 pdf.ln(5)
 
@@ -311,35 +734,55 @@ class JiraSolutionExtractor:
     def run(self):
         """Run the solution extraction and FAQ generation process"""
         try:
+            # Skip the issues an interrupted run already analyzed
+            analyzed_keys = self.load_checkpoint()
+
             # 1. Get all issues
             issues = self.get_all_issues()
 
             # 2. Extract data including comments
-            issue_data = self.extract_issue_data(issues)
+            issue_data = (issue for issue in self.extract_issue_data(issues) if issue.key not in analyzed_keys)
 
-            # 3. Extract solutions
-            issues_with_solutions = self.extract_solutions(issue_data)
+            # 3. Extract solutions, streaming the results to the solutions file
+            with open(self.solutions_path, 'ab') as solutions_file:
+                for issue in self.extract_solutions(issue_data):
+                    solutions_file.write(orjson.dumps(issue) + b'\n')
 
             # 4. Generate FAQ documentation
-            if issues_with_solutions:
-                pdf_path = self.generate_faq_documentation(issues_with_solutions)
-                print(f"Found solutions for {len(issues_with_solutions)} out of {len(issue_data)} issues.")
+            solutions_by_type, analyzed_count = self.collect_solutions()
+            solution_count = sum(len(offsets) for offsets in solutions_by_type.values())
+            if solution_count:
+                pdf_path = self.generate_faq_documentation(solutions_by_type)
+                print(f"Found solutions for {solution_count} out of {analyzed_count} issues.")
                 print("FAQ generation complete!")
-                return pdf_path
             else:
                 print("No solutions found in any issues. No documentation generated.")
-                return None
+                pdf_path = None
+
+            # The run is complete, the next one starts from scratch
+            os.remove(self.solutions_path)
+            return pdf_path
 
         except Exception as e:
             print(f"Error during solution extraction: {str(e)}")
             return None
 
+def positive_int(value):
+    """argparse type for the options that need a number of at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Extract solutions from Jira project and create FAQ documentation')
     parser.add_argument('--project', required=True, help='Jira project key')
-    parser.add_argument('--model', default='deepseek-r1:7b', help='Ollama model to use (default:deepseek-r1:7b)')
+    parser.add_argument('--model', default='llama3.2:3b-instruct-q4_K_M', help='Ollama model to use (default: llama3.2:3b-instruct-q4_K_M)')
     parser.add_argument('--ollama-url', default='http://localhost:11434', help='URL for Ollama API (default: http://localhost:11434)')
+    parser.add_argument('--page-size', type=positive_int, default=1000, help='Number of issues to request per Jira page (default: 1000)')
+    parser.add_argument('--batch-size', type=positive_int, default=4, help='Number of small issues to analyze per Ollama call, 1 disables batching (default: 4)')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore the cache of previous Ollama responses in output/.ai_cache.sqlite')
     args = parser.parse_args()
 
     # Load credentials from environment variables
@@ -358,7 +801,10 @@ if __name__ == "__main__":
         jira_email=jira_email,
         project_key=args.project,
         ollama_url=args.ollama_url,
-        model_name=args.model
+        model_name=args.model,
+        page_size=args.page_size,
+        batch_size=args.batch_size,
+        use_cache=not args.no_cache
     )
 
     extractor.run()